@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 # Field size in feet
 FIELD_LENGTH = 90
 FIELD_WIDTH = 46
@@ -71,6 +73,35 @@ class OverheadCamera:
     def pixelsToCartesian(self, x, y):
         return self.sphericalToCartesian(self.pixelsToSpherical(x, y))
 
+    def pixelsToCartesianBatch(self, pts_xy):
+        """
+        Convert many pixel points to field coordinates at once.
+        Performs the same calculation as pixelsToCartesian on every row of the array.
+
+        :param pts_xy:              An (N, 2) array of (x, y) pixel coordinates
+        :return:                    An (N, 3) array of (x, y, z) field coordinates
+        """
+        pts_xy = np.asarray(pts_xy, dtype=np.float64).reshape(-1, 2)
+        x = pts_xy[:, 0]
+        y = pts_xy[:, 1]
+
+        # Apply the same fisheye lens correction as pixelsToSpherical
+        delta_x = self.image_size[0] / 2 - x
+        corrected_y = y - 0.00021 * delta_x * delta_x
+        delta_y = corrected_y - self.image_size[1] / 2
+
+        phi = np.radians(self.cam_phi + self.field_of_view[0] * delta_x / self.image_size[0])
+        theta = np.radians(self.cam_theta + self.field_of_view[1] * delta_y / self.image_size[1])
+        radius = -self.z_offset / np.cos(theta)
+
+        cartesian_points = np.empty((len(pts_xy), 3))
+        horizontal_radius = radius * np.sin(theta)
+        cartesian_points[:, 0] = horizontal_radius * np.cos(phi) + FIELD_LENGTH / 2 - self.x_offset
+        cartesian_points[:, 1] = horizontal_radius * np.sin(phi) + self.y_offset
+        cartesian_points[:, 2] = -self.z_offset
+
+        return cartesian_points
+
     def cartesianToSpherical(self, cartesian_point):
         x, y = cartesian_point
         x = x - FIELD_LENGTH / 2 + self.x_offset
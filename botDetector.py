@@ -1,73 +1,96 @@
 import math
+
+import numpy as np
+
 import botPatterns
 
+try:
+    # Numba compiles the numeric kernels below to machine code, but is not required to run the detector
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def decorator(function):
+            return function
+        return decorator
 
-def groupNearbyPoints(points, threshold_distance):
+
+@njit(cache=True, fastmath=True)
+def labelNearbyPoints(points, threshold_distance):
     """
-    Group rectangular points together if they are closer than a given distance.
-    :param points:                  A list of points to group as (x, y) tuples
+    Label rectangular points so that points closer than a given distance, directly or through other points, share a label.
+    :param points:                  An (N, 2) array of points
     :param threshold_distance:      The maximum distance between two points to consider them a group
-    :return:                        A list of groups, which are each a list of close points
+    :return:                        An array of N group labels, where each label is the index of a point in the group
     """
 
-    # If there are no points, return no groups
-    if len(points) < 1:
-        return []
+    num_points = points.shape[0]
 
-    # Start a group using the first point
-    groups = [[points[0]]]
+    # Every point starts in its own group, identified by a parent point
+    parents = np.arange(num_points)
+    threshold_squared = threshold_distance * threshold_distance
 
-    # Group the rest of the points
-    for point in points[1:]:
+    # Sweep across the points in order of x so that each point is only compared to the points
+    # within the threshold distance of it along the x axis, rather than to every other point
+    order = np.argsort(points[:, 0])
 
-        # List all groups that the point is close enough to be part of
-        eligible_groups = []
+    for order_i in range(num_points):
+        i = order[order_i]
 
-        # Check each existing group
-        for group_idx in range(len(groups)):
+        for order_j in range(order_i + 1, num_points):
+            j = order[order_j]
 
-            group = groups[group_idx]
+            dx = points[j, 0] - points[i, 0]
+            if dx > threshold_distance:
+                break
 
-            # Check the proximity of the current point to each point in the group
-            for ref_point in group:
+            dy = points[i, 1] - points[j, 1]
 
-                # If the current point is close enough to any point in the group,
-                # it is eligible to be a member of that group
-                if distance(point, ref_point) <= threshold_distance:
-                    eligible_groups.append(group_idx)
-                    break
+            if dx * dx + dy * dy <= threshold_squared:
 
-        # If there are no groups this point is eligible to be added to, make it its own new group
-        if len(eligible_groups) < 1:
-            groups.append([point])
+                # Find the root point of each group and merge the groups if they differ
+                root_i = i
+                while parents[root_i] != root_i:
+                    root_i = parents[root_i]
 
-        # Otherwise, make a new group and merge all the eligible groups together, since this point connects them all
-        else:
-            new_group = [point]
+                root_j = j
+                while parents[root_j] != root_j:
+                    root_j = parents[root_j]
 
-            for group_idx in eligible_groups:
+                if root_i != root_j:
+                    parents[max(root_i, root_j)] = min(root_i, root_j)
 
-                # Get the group, add a copy of it to the new group, and make the old group empty
-                group = groups[group_idx]
-                new_group += group.copy()
-                groups[group_idx] = []
+    # Label each point with the root point of its group
+    labels = np.empty(num_points, dtype=np.int64)
+    for i in range(num_points):
+        root = i
+        while parents[root] != root:
+            root = parents[root]
+        labels[i] = root
 
-            groups.append(new_group)
+    return labels
 
-    # Clean up the groups before returning them
-    cleaned_groups = []
-    for group in groups:
 
-        # Remove all empty groups that were produced when groups were merged
-        if len(group) < 1:
-            continue
+def groupNearbyPoints(points, threshold_distance):
+    """
+    Group rectangular points together if they are closer than a given distance.
+    :param points:                  A list of points to group as (x, y) tuples
+    :param threshold_distance:      The maximum distance between two points to consider them a group
+    :return:                        A list of groups, which are each a list of close points
+    """
+
+    # If there are no points, return no groups
+    if len(points) < 1:
+        return []
 
-        # Remove duplicate points from each group
-        cleaned_group = removeDuplicatePoints(group, 0.01)
+    labels = labelNearbyPoints(np.asarray(points, dtype=np.float64).reshape(-1, 2), float(threshold_distance))
 
-        cleaned_groups.append(cleaned_group)
+    # Collect the points of each group in the order the groups first appear
+    groups = {}
+    for point, label in zip(points, labels.tolist()):
+        groups.setdefault(label, []).append(tuple(point))
 
-    return cleaned_groups
+    # Remove duplicate points from each group before returning them
+    return [removeDuplicatePoints(group, 0.01) for group in groups.values()]
 
 
 def removeDuplicatePoints(points, tolerance):
@@ -172,140 +195,153 @@ def cartesianToPolar(cart_vector):
     return r, theta
 
 
-# The idea is to treat the LED board like a wheel.
-# There is a center point and 8 spokes.
-# Find the center point if it exists and the angles between each spoke.
-def detectShape(group, pattern):
+def patternSpokeAngles(pattern):
     """
-    Evaluate how similar a group of given points is to a specified pattern of points.
-    A lower score returned indicates a higher similarity.
-    :param group:           The group of points to match to a pattern
-    :param pattern:         The pattern (2D list of binary numbers) to match the points to
-    :return:                A score indicating the similarity between the group and pattern
+    Get the angles of the outside points of a pattern, which are the spokes of the pattern's wheel.
+    :param pattern:         The pattern (2D list of binary numbers) to get the spokes of
+    :return:                An array of the spoke angles in degrees, sorted in increasing order
     """
 
-    pattern_size = numPointsInPattern(pattern)
+    # Only the angles of the spokes are matched, so their length does not matter
+    return np.array([spoke[1] for spoke in convertPatternToPoints(pattern, 1)], dtype=np.float64)
 
-    # The group won't match the pattern if it doesn't contain as many LEDs as the pattern
-    # Return the worst possible score
-    if len(group) < pattern_size:
-        return math.inf
 
-    # Get the center of the group
-    group_center = groupCenters([group])[0]
+def groupSpokeAngles(group):
+    """
+    Get the angles of the spokes of a group's wheel, both with and without a point at the center of the wheel.
+    :param group:           The group of points as (x, y) tuples
+    :return:                A tuple of two arrays of spoke angles in degrees normalized to [0, 360).
+                            The first uses the average position of the group as the center of the wheel.
+                            The second uses the point closest to the average position as the center of the wheel,
+                            and does not include that point as a spoke.
+    """
 
-    remaining_points = group.copy()
+    points = np.asarray(group, dtype=np.float64).reshape(-1, 2)
 
-    # If the pattern has a point in the center position,
-    # find the point that is closest to the calculated center and use that as the group center
-    center_point = group_center
-    center_state = pattern[1][1]
-    if center_state > 0:
+    # Get the spokes around the center of the group
+    offsets = points - points.mean(axis=0)
+    mean_angles = np.degrees(np.arctan2(offsets[:, 1], offsets[:, 0])) % 360
 
-        # Get the center point of the group
-        min_distance = math.inf
-        center_point_idx = -1
-        for point_idx in range(len(group)):
-            point = group[point_idx]
+    # Get the spokes around the point that is closest to the center of the group
+    center_point_idx = np.argmin(np.hypot(offsets[:, 0], offsets[:, 1]))
+    offsets = np.delete(points, center_point_idx, axis=0) - points[center_point_idx]
+    center_point_angles = np.degrees(np.arctan2(offsets[:, 1], offsets[:, 0])) % 360
 
-            point_distance = distance(group_center, point)
-            if point_distance < min_distance:
-                min_distance = point_distance
-                center_point_idx = point_idx
+    return mean_angles, center_point_angles
 
-        center_point = remaining_points.pop(center_point_idx)
 
-    # Convert all the remaining points to polar coordinates
-    # with the center point as the origin of the polar coordinate frame
-    spoke_points = normalizeAngles(cartesianToPolarList(remaining_points, center_point))
+def describePattern(pattern):
+    """
+    Get the properties of a pattern that are needed to match groups of points to it.
+    Describing a pattern once and reusing the description avoids recomputing it for every frame.
+    :param pattern:         The pattern (2D list of binary numbers) to describe
+    :return:                A tuple of the number of points in the pattern, whether the pattern has a center point,
+                            and an array of the angles of the pattern's spokes
+    """
+    return numPointsInPattern(pattern), pattern[1][1] > 0, patternSpokeAngles(pattern)
+
+
+# The idea is to treat the LED board like a wheel.
+# There is a center point and 8 spokes.
+# Find the center point if it exists and the angles between each spoke.
+def scoreGroups(groups, pattern_descriptions):
+    """
+    Evaluate how similar each group of given points is to each of the described patterns of points.
+    A lower score indicates a higher similarity.
+    :param groups:                  The list of groups of points to match to the patterns
+    :param pattern_descriptions:    The list of pattern descriptions, as returned by describePattern
+    :return:                        An array of scores with a row for each pattern and a column for each group
+    """
 
-    # Get the length of the shortest spoke in the wheel
-    side_spoke_length = min([spoke[0] for spoke in spoke_points])
+    scores = np.full((len(pattern_descriptions), len(groups)), math.inf)
 
-    pattern_spokes = pattern.copy()
-    pattern_spokes[1][1] = 0
+    for group_idx in range(len(groups)):
+        group = groups[group_idx]
 
-    expected_spokes = convertPatternToPoints(pattern, side_spoke_length)
+        if len(group) < 1:
+            continue
 
-    match_score = matchWheels(expected_spokes, spoke_points)
+        # Describe each group once rather than once per pattern
+        group_angles = groupSpokeAngles(group)
 
-    return match_score
+        for pattern_idx in range(len(pattern_descriptions)):
+            pattern_size, pattern_has_center, expected_angles = pattern_descriptions[pattern_idx]
 
+            # The group won't match the pattern if it doesn't contain as many LEDs as the pattern
+            # Leave the worst possible score
+            if len(group) < pattern_size:
+                continue
 
-def matchWheels(pattern_wheel, seen_wheel):
-    """
+            # If the pattern has a point in the center position,
+            # the point that is closest to the calculated center is used as the center of the group's wheel
+            seen_angles = group_angles[1] if pattern_has_center else group_angles[0]
 
-    :param pattern_wheel:
-    :param seen_wheel:
-    :return:
-    """
+            if len(expected_angles) < 1 or len(seen_angles) < len(expected_angles):
+                continue
 
-    if len(pattern_wheel) < 1 or len(seen_wheel) < 1:
-        return math.inf
+            scores[pattern_idx, group_idx] = matchWheelAngles(expected_angles, seen_angles)
 
-    # Use the first spoke of the smaller wheel as the angle reference
-    ref_spoke = pattern_wheel[0]
+    return scores
+
+
+@njit(cache=True, fastmath=True)
+def matchWheelAngles(pattern_angles, seen_angles):
+    """
+    Find the smallest average angle error between two wheels over all alignments of the seen wheel.
+    The seen wheel must have at least as many spokes as the pattern wheel.
+    :param pattern_angles:  An array of the spoke angles of the pattern wheel in degrees
+    :param seen_angles:     An array of the spoke angles of the seen wheel in degrees
+    :return:                The lowest average angle error per spoke
+    """
 
-    best_match_score = math.inf
+    num_pattern = pattern_angles.shape[0]
+    num_seen = seen_angles.shape[0]
 
-    # For each spoke in the larger wheel
-    for seen_spoke in seen_wheel:
+    # Use the first spoke of the pattern wheel as the angle reference
+    ref_angle = pattern_angles[0]
 
-        # Get the angle difference between the spoke and the reference spoke
-        phase = seen_spoke[1] - ref_spoke[1]
-        angle_diff_sum = 0
+    best_match_score = -1.0
+    rotated_angles = np.empty(num_seen)
+    used = np.empty(num_seen, dtype=np.bool_)
 
-        # Make a copy of the larger wheel and rotate it
-        # to align the selected spoke with the smaller wheel's reference spoke
-        seen_wheel_copy = seen_wheel.copy()
-        for j in range(len(seen_wheel_copy)):
-            seen_wheel_copy[j] = seen_wheel_copy[j][0], seen_wheel_copy[j][1] - phase
+    # For each spoke in the seen wheel
+    for i in range(num_seen):
 
-        # Normalize all the angles of the spokes to [0, 360)
-        seen_wheel_copy = normalizeAngles(seen_wheel_copy)
+        # Rotate the seen wheel to align the selected spoke with the reference spoke
+        # and normalize all the angles of the spokes to [0, 360)
+        phase = seen_angles[i] - ref_angle
+        for j in range(num_seen):
+            rotated_angles[j] = (seen_angles[j] - phase) % 360
+            used[j] = False
 
-        # Try and match each spoke in the pattern wheel
-        for pattern_wheel_spoke in pattern_wheel:
+        angle_diff_sum = 0.0
+
+        # Match each pattern spoke to the unused seen spoke with the closest angle
+        for k in range(num_pattern):
             matching_spoke_idx = -1
-            min_angle_diff = math.inf
+            min_angle_diff = 0.0
 
-            # Find the spoke in the seen wheel that has the closest angle to the selected pattern spoke
-            for j in range(len(seen_wheel_copy)):
-                seen_wheel_copy_spoke = seen_wheel_copy[j]
-                angle_diff = abs(seen_wheel_copy_spoke[1] - pattern_wheel_spoke[1])
+            for j in range(num_seen):
+                if used[j]:
+                    continue
 
-                if angle_diff < min_angle_diff:
+                angle_diff = abs(rotated_angles[j] - pattern_angles[k])
+                if matching_spoke_idx < 0 or angle_diff < min_angle_diff:
                     matching_spoke_idx = j
                     min_angle_diff = angle_diff
 
-            best_match_spoke = seen_wheel_copy.pop(matching_spoke_idx)
-
+            used[matching_spoke_idx] = True
             angle_diff_sum += min_angle_diff
 
         # The match score is the average angle error per spoke
-        match_score = angle_diff_sum / len(pattern_wheel)
+        match_score = angle_diff_sum / num_pattern
 
-        if match_score < best_match_score:
+        if best_match_score < 0 or match_score < best_match_score:
             best_match_score = match_score
 
     return best_match_score
 
 
-def normalizeAngles(polar_points):
-    """
-    Given a list of 2D points in polar coordinates, normalize their angles to [0, 360)
-    :param polar_points:    The list of points to normalize
-    :return:                The list of points with normalized angles
-    """
-
-    normalized_points = []
-    for point in polar_points:
-        new_point = point[0], point[1] % 360
-        normalized_points.append(new_point)
-
-    return normalized_points
-
-
 def convertPatternToPoints(pattern, distance):
     """
     Convert a pattern into a set of points given the expected distance between points.
@@ -315,7 +351,7 @@ def convertPatternToPoints(pattern, distance):
     """
 
     # Make a copy of the pattern with the center point empty to represent only the outside points of the pattern
-    pattern_points = pattern.copy()
+    pattern_points = [row.copy() for row in pattern]
     pattern_points[1][1] = 0
 
     expectedPoints = []
@@ -354,25 +390,6 @@ def angleDiff(point1, point2):
     return abs(point1[1] - point2[1])
 
 
-def cartesianToPolarList(points, origin_point):
-    """
-    Convert a list of 2D Cartesian points to polar form.
-    :param points:          The list of 2D Cartesian points
-    :param origin_point:    The point to use as the origin of the polar coordinate system
-    :return:                The list of converted points in polar form
-    """
-
-    polar_points = []
-    for point in points:
-
-        # Get the displacement vector of the point from the origin and convert it to polar
-        relative_point = displacement(origin_point, point)
-        polar_point = cartesianToPolar(relative_point)
-        polar_points.append(polar_point)
-
-    return polar_points
-
-
 def displacement(ref_point, point):
     """
     Get the rectangular displacement vector between a point and a reference point.
@@ -1,21 +1,31 @@
 import datetime
-import os
+import queue
 import select
-import shutil
+import signal
 import socket
+import threading
 import time
 
 import cv2
+import numpy as np
 
 import botDetector
 from OverheadCamera import OverheadCamera as oc
 from botDetector import *
 
 
-def getPitch():
-    mag_x, mag_y, mag_z = sensor.magnetic
-    pitch_rad = math.atan2(mag_y, math.sqrt(mag_x ** 2 + mag_z ** 2))
-    pitch_deg = math.degrees(pitch_rad) % 360
+def getPitch(magnetic=None):
+    """
+    Get the compass heading from magnetometer readings.
+    :param magnetic:        An (x, y, z) reading, or arrays of many readings, from the magnetometer.
+                            Reads the magnetometer if no reading is given.
+    :return:                The heading in degrees in [0, 360), or an array of headings if arrays were given
+    """
+    if magnetic is None:
+        magnetic = sensor.magnetic
+
+    mag_x, mag_y, mag_z = magnetic
+    pitch_deg = np.degrees(np.arctan2(mag_y, np.hypot(mag_x, mag_z))) % 360.0
 
     return pitch_deg
 
@@ -25,7 +35,20 @@ RUN_SERVER = False  # Will run a server and wait for a client connection if True
 IS_RPI = True  # Set to True for the Raspberry Pi, False to test on a Windows computer
 DISPLAY = True  # Will only open a window to view the camera frames if this is True
 SAVE_FRAME_RATE = 4  # Frame rate to save captured images for later viewing. Will not save if set to 0 or negative.
+PACKET_SIZE = 256  # Maximum number of bytes to read from the TCP client at once
+SEND_TIMEOUT = 10  # Seconds to wait for the TCP client to accept data before giving up
 HAS_COMPASS = False  # If true, will attempt to use a magnetometer to find the compass heading of the field's major axis
+BOTS_IN_PLAY = ['Y']  # Names of the LED patterns of the bots to detect, as defined in botPatterns
+PROCESSING_SCALE = 2  # Factor by which frames are downscaled before LED detection. Set to 1 to process full frames.
+USE_OPENCL = True  # Will process frames on the GPU through OpenCL if True and OpenCL is available
+MAX_FAILED_READS = 10  # Number of failed webcam reads in a row after which the application stops
+STRIPE_HEIGHT = 64  # Rows of the downscaled frame to threshold at a time, small enough for a stripe to stay in cache
+
+# Drawing parameters for the displayed and recorded frames
+CONTOUR_COLOR = (255, 255, 0)  # BGR color of the LED boundaries
+CENTER_COLOR = (0, 255, 255)  # BGR color of the LED center points
+TEXT_COLOR = (0, 255, 0)  # BGR color of the LED position labels
+LED_FMT = 'LED position: {:.2f}, {:.2f}'.format  # Formats the label of an LED from its field position
 
 
 def constructDataPacket():
@@ -33,27 +56,219 @@ def constructDataPacket():
 
 
 #  Define a function to perform the contour detection
-def getAllContours(grayscale_img):
-    canny = cv2.Canny(grayscale_img, 50, 240)
-    contours, _ = cv2.findContours(canny, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+def getAllContours(binary_img):
+    # The image is already binary, so the outer boundaries of the white spots can be found without edge detection
+    contours, _ = cv2.findContours(binary_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     return contours
 
 
-def makeVideo(name, image_folder):
-    images = [img for img in sorted(os.listdir(image_folder)) if img.endswith('.jpg')]
-    if len(images) < 1:
-        return
+def binarizeFrame(gray_frame, gray_buf, bin_buf):
+    """
+    Downscale a grayscale frame and identify its bright spots, such as LEDs, in a binary image.
+    The frame is processed on the GPU if OpenCL is available and enabled.
+    Otherwise, it is processed in horizontal stripes so that each stripe stays in the CPU cache between steps.
+    :param gray_frame:      The full-size grayscale frame
+    :param gray_buf:        The buffer in which to put the downscaled grayscale frame
+    :param bin_buf:         The buffer in which to put the binary image, which is the same size as gray_buf
+    :return:                The binary image
+    """
+    height, width = bin_buf.shape
+
+    # With OpenCL, process the whole frame on the GPU and copy only the binary image back for labelling
+    if cv2.ocl.useOpenCL():
+        gray_umat = cv2.UMat(gray_frame[:height * PROCESSING_SCALE, :width * PROCESSING_SCALE])
+        gray_small = cv2.resize(gray_umat, (width, height), interpolation=cv2.INTER_AREA)
+        _, binary_umat = cv2.threshold(gray_small, 230, 255, cv2.THRESH_BINARY)
+        return binary_umat.get()
+
+    for y0 in range(0, height, STRIPE_HEIGHT):
+        y1 = min(y0 + STRIPE_HEIGHT, height)
+
+        # Downscale the stripe, since LEDs are blobs many pixels wide
+        # Each output pixel averages a whole block of input pixels, so the stripes join without seams
+        gray_stripe = gray_buf[y0:y1]
+        cv2.resize(gray_frame[y0 * PROCESSING_SCALE:y1 * PROCESSING_SCALE, :width * PROCESSING_SCALE],
+                   (width, y1 - y0), dst=gray_stripe, interpolation=cv2.INTER_AREA)
+
+        cv2.threshold(gray_stripe, 230, 255, cv2.THRESH_BINARY, dst=bin_buf[y0:y1])
+
+    return bin_buf
+
+
+def putLatest(item_queue, item):
+    """
+    Put an item in a bounded queue, dropping the oldest queued item if the queue is full.
+    This keeps consumers working on the newest data instead of a backlog of stale data.
+    :param item_queue:      The queue to put the item in
+    :param item:            The item to put in the queue
+    """
+    try:
+        item_queue.put_nowait(item)
+    except queue.Full:
+        try:
+            item_queue.get_nowait()
+        except queue.Empty:
+            pass
+        item_queue.put_nowait(item)
+
+
+def captureFrames(frame_queue, stop_event, keep_color):
+    """
+    Continuously capture frames from the camera and queue the newest one for detection.
+    Each queued item is a tuple of the grayscale frame and the color frame, which is None if it is not kept.
+    :param frame_queue:     The queue to put captured frames in
+    :param stop_event:      The event that signals the thread to stop
+    :param keep_color:      Whether to also queue the color frame for display and recording
+    """
+    failed_reads = 0
+
+    # Stop the whole application if capturing fails, rather than leaving detection waiting for frames
+    try:
+        while not stop_event.is_set():
+            frame = None
+
+            if IS_RPI:
+                # The Y plane at the top of the YUV420 frame is already a grayscale image
+                yuv_frame = picam2.capture_array('main')
+                gray_frame = yuv_frame[:CAM_HEIGHT, :CAM_WIDTH]
+
+                if keep_color:
+                    frame = cv2.cvtColor(yuv_frame, cv2.COLOR_YUV420p2BGR)
+
+            else:
+                ret, color_frame = vid.read()
+
+                # Give the webcam a moment to recover from a failed read, and give up if it does not
+                if not ret:
+                    failed_reads += 1
+                    if failed_reads >= MAX_FAILED_READS:
+                        print('Cannot read frames from camera...')
+                        break
+
+                    time.sleep(0.1)
+                    continue
+
+                failed_reads = 0
+
+                # Drop the color channels here so the detection thread never handles the full color frame
+                gray_frame = cv2.cvtColor(color_frame, cv2.COLOR_BGR2GRAY)
+
+                if keep_color:
+                    frame = color_frame
+
+            putLatest(frame_queue, (gray_frame, frame))
+
+    finally:
+        stop_event.set()
+
+
+def writeFrames(name, record_queue):
+    """
+    Write queued frames to a video file until None is queued.
+    :param name:            The name of the video file without its extension
+    :param record_queue:    The queue to take frames from
+    """
+    video = None
+
+    while True:
+        frame = record_queue.get()
+        if frame is None:
+            break
+
+        # Open the video once the size of the frames is known
+        if video is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            video = cv2.VideoWriter(name + '.mp4', fourcc, SAVE_FRAME_RATE, (width, height))
+
+        video.write(frame)
 
-    frame = cv2.imread(os.path.join(image_folder, images[0]))
-    height, width, layers = frame.shape
+    if video is not None:
+        video.release()
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video = cv2.VideoWriter(name + '.mp4', fourcc, SAVE_FRAME_RATE, (width, height))
 
-    for image in images:
-        video.write(cv2.imread(os.path.join(image_folder, image)))
+def drainSocket():
+    """
+    Read and discard everything the TCP client has sent without waiting for more.
+    :return:                False if the client closed or reset the connection, otherwise True
+    """
+    while True:
+        ready_sockets, _, _ = select.select([conn], [], [], 0)
+        if not ready_sockets:
+            return True
+
+        try:
+            data = conn.recv(PACKET_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            # The client reset or otherwise broke the connection
+            return False
+
+        if not data:
+            return False
+
+
+def sendPacket(data):
+    """
+    Send all bytes of a packet over the non-blocking TCP socket.
+    :param data:            The bytes to send
+    :return:                True if all bytes were sent, otherwise False
+    """
+    while data:
+        _, ready_sockets, _ = select.select([], [conn], [], SEND_TIMEOUT)
+        if not ready_sockets:
+            print('Client is not receiving')
+            return False
+
+        try:
+            sent = conn.send(data)
+        except BlockingIOError:
+            continue
+        except ConnectionError:
+            print('Client disconnected')
+            return False
+
+        data = data[sent:]
+
+    return True
+
+
+def sendPositions(data):
+    """
+    Transmit the positions of the detected bots to the TCP client.
+    :param data:            The packed bot positions, as produced by positions.tobytes() in the main loop
+    :return:                True if the positions were sent, otherwise False
+    """
+
+    # Discard any acknowledgements from the client rather than waiting on them
+    if not drainSocket():
+        print('Client disconnected')
+        return False
+
+    return sendPacket(data)
+
+
+def transmitPositions(positions_queue, stop_event):
+    """
+    Continuously transmit the newest detected bot positions to the TCP client.
+    Stops the whole application if the client stops responding.
+    :param positions_queue: The queue to take packed bot positions from
+    :param stop_event:      The event that signals the thread to stop
+    """
+    # Stop the whole application if transmitting fails for any reason
+    try:
+        while not stop_event.is_set():
+            try:
+                data = positions_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
 
-    video.release()
+            if not sendPositions(data):
+                break
+
+    finally:
+        stop_event.set()
 
 
 CAM_WIDTH = 4656  # Width of the camera frame in pixels
@@ -75,7 +290,8 @@ if IS_RPI:
 
     # Set up the Raspberry Pi webcam
     picam2 = Picamera2()
-    picam2.configure(picam2.create_preview_configuration(main={'format': 'XRGB8888', 'size': (CAM_WIDTH, CAM_HEIGHT)}))
+    # Capture YUV420 frames so the grayscale image needed for detection is available without any conversion
+    picam2.configure(picam2.create_preview_configuration(main={'format': 'YUV420', 'size': (CAM_WIDTH, CAM_HEIGHT)}))
 
     picam2.start()
     print('Configuring exposure...')
@@ -117,14 +333,31 @@ else:
 
     # Set up the default Windows webcam
     vid = cv2.VideoCapture(0)
+
+    # Request MJPG frames to reduce USB bandwidth
+    # This must be set before the frame size for some camera backends to accept it
+    vid.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
     vid.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
     vid.set(cv2.CAP_PROP_FRAME_HEIGHT, CAM_HEIGHT)
     vid.set(cv2.CAP_PROP_EXPOSURE, exposure_factor)
 
+    # Only buffer the newest frame so detection is never run on stale frames
+    vid.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
     if not vid.isOpened():
         print('Cannot open camera...')
         exit()
 
+# Describe the pattern of each bot once instead of every frame
+# The descriptions are in the same order as BOTS_IN_PLAY
+PATTERNS = [botDetector.describePattern(botPatterns.getPattern(bot)) for bot in BOTS_IN_PLAY]
+
+# Enable OpenCL for the image processing if requested
+# OpenCV ignores this if no OpenCL device is available, and frames are then processed on the CPU
+cv2.ocl.setUseOpenCL(USE_OPENCL)
+if cv2.ocl.useOpenCL():
+    print('Processing frames with OpenCL...')
+
 # Define the overhead camera object that performs coordinate transformations
 # Use feet for the height and offset measurements to ensure the output of the algorithm is also in feet
 cam = oc(
@@ -153,6 +386,10 @@ if RUN_SERVER:
     conn, address = server_socket.accept()
     print('Accepting TCP session from ' + str(address))
 
+    # Never block detection on the client, and send small packets immediately instead of coalescing them
+    conn.setblocking(False)
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
 
 def main():
     # Get a unique name for the recording of the session
@@ -165,171 +402,162 @@ def main():
         frame_interval = 1 / SAVE_FRAME_RATE
         record = True
 
-        # If the application needs to record, make an empty folder in which to save images
-        if os.path.exists(session_name):
-            shutil.rmtree(session_name)
-        os.makedirs(session_name)
-
-    # Get the start time of the session
-    start = time.time()
-    mark = start
-
-    # Main loop
-    while True:
-
-        # Capture a frame from the webcam
-        if IS_RPI:
-            frame = picam2.capture_array()
-        else:
-            _, frame = vid.read()
-
-        # If q is pressed, stop the main loop
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    # Only keep and draw on the color frame if it will be viewed
+    annotate = DISPLAY or record
 
-        # Convert frame to grayscale
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    # Allocate the bot positions once, with one (x, y) row per bot in the order of BOTS_IN_PLAY
+    # The client receives them as len(BOTS_IN_PLAY) * 2 little-endian 32-bit floats per frame
+    positions = np.empty((len(BOTS_IN_PLAY), 2), dtype='<f4')
 
-        # Identify bright spots in the image such as LEDs and put them in a binary image
-        _, binary_m = cv2.threshold(gray_frame, 230, 255, cv2.THRESH_BINARY)
+    # Allocate the grayscale and binary images once so every frame reuses the same memory
+    gray_buf = np.empty((CAM_HEIGHT // PROCESSING_SCALE, CAM_WIDTH // PROCESSING_SCALE), np.uint8)
+    bin_buf = np.empty_like(gray_buf)
 
-        # Get all contours (boundaries of the white spots) in the binary image
-        contours = getAllContours(binary_m)
+    # Run capture, detection, and transmission concurrently
+    # Each queue only holds the newest item so no stage works on stale data
+    stop_event = threading.Event()
+    frame_queue = queue.Queue(maxsize=1)
+    positions_queue = queue.Queue(maxsize=1)
 
-        # Get a list of the center points of all LEDs
-        LEDs = []
-
-        # Print each contour on the original frame
-        for contour in contours:
-
-            # Get the center point of the contour
-            M = cv2.moments(contour)
-            if M["m00"] != 0 and cv2.contourArea(contour) > 1:
-                # Draw the contour
-                cv2.drawContours(frame, [contour], -1, (255, 255, 0), 3)
-
-                # Find and draw the contour's center
-                cX = int(M['m10'] / M['m00'])
-                cY = int(M['m01'] / M['m00'])
+    threads = [threading.Thread(target=captureFrames, args=(frame_queue, stop_event, annotate),
+                                daemon=True)]
+    if RUN_SERVER:
+        threads.append(threading.Thread(target=transmitPositions, args=(positions_queue, stop_event), daemon=True))
 
-                cv2.circle(frame, (cX, cY), 4, (0, 255, 255), -1)
+    for thread in threads:
+        thread.start()
 
-                # Convert the pixel coordinates to field coordinates
-                x, y, z = cam.pixelsToCartesian(cX, cY)
-                LEDs.append((x, y))
+    # Encode the recording on its own thread as frames are captured
+    # Up to a second of frames can wait to be encoded before the oldest ones are dropped
+    if record:
+        record_queue = queue.Queue(maxsize=math.ceil(SAVE_FRAME_RATE))
+        record_thread = threading.Thread(target=writeFrames, args=(session_name, record_queue))
+        record_thread.start()
 
-                cv2.putText(frame, 'LED position: {:.2f}, {:.2f}'.format(x, y), (cX, cY), cv2.FONT_HERSHEY_PLAIN, 1,
-                            (0, 255, 0), 2, cv2.LINE_AA)
+    # Stop the main loop cleanly on Ctrl+C, which is the only way to quit without a display window
+    # A second Ctrl+C raises KeyboardInterrupt as usual, in case the clean stop gets stuck
+    def stopOnInterrupt(signum, frame):
+        stop_event.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
 
-        if record:
-            # If the current time exceeds the time at which the next frame should be captured, save the current frame
-            now = time.time()
-            if now - mark >= 0:
-                mark = mark + frame_interval
+    signal.signal(signal.SIGINT, stopOnInterrupt)
 
-                cv2.imwrite(session_name + '/' + str(now) + '.jpg', frame)
+    # Get the start time of the session
+    start = time.time()
+    mark = start
 
-        groups = botDetector.groupNearbyPoints(LEDs, 1)
-        X = []
-        best_X_score = math.inf
-        for group in groups:
+    # Always stop the threads and release the camera, socket, and recording, even if detection fails
+    try:
+        # Main loop, which performs the detection
+        while not stop_event.is_set():
 
-            if len(group) < 1:
+            # Get the newest frame from the camera
+            try:
+                gray_frame, frame = frame_queue.get(timeout=0.1)
+            except queue.Empty:
                 continue
 
-            score = botDetector.detectShape(group, botPatterns.getPattern('Y'))
-            if score < best_X_score:
-                X = group
-                best_X_score = score
-                print('Matching score: ' + str(score))
-
-        LEDs = botDetector.groupCenters([X])
+            # If q is pressed in the display window, stop the main loop
+            # Without a window there are no key presses to check, so the wait is skipped
+            if DISPLAY and cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
-        if len(LEDs) > 0:
-            X_point = LEDs[0]
-            # print(X_point)
-            sphere_point = cam.cartesianToSpherical(X_point)
-            # print(sphere_point)
-            print(cam.sphericalToPixels(sphere_point))
+            # Identify bright spots in the image such as LEDs and put them in a binary image
+            # The full-size color frame is kept for display and recording only
+            binary_m = binarizeFrame(gray_frame, gray_buf, bin_buf)
+
+            # Label the white spots in the binary image and get the area and center point of each in one pass
+            _, _, stats, centroids = cv2.connectedComponentsWithStats(binary_m, connectivity=8)
+
+            # Label 0 is the background, so skip it and filter out single-pixel noise
+            is_LED = stats[1:, cv2.CC_STAT_AREA] > 1
+            LED_pixels = centroids[1:][is_LED] * PROCESSING_SCALE
+
+            # Get a list of the center points of all LEDs in field coordinates
+            LED_points = cam.pixelsToCartesianBatch(LED_pixels)
+            LEDs = list(map(tuple, LED_points[:, :2].tolist()))
+
+            # Print each LED on the original frame if it will be viewed
+            if annotate:
+
+                # Draw the contours (boundaries of the white spots), scaled back up to the size of the original frame
+                contours = getAllContours(binary_m)
+                cv2.drawContours(frame, [contour * PROCESSING_SCALE for contour in contours], -1, CONTOUR_COLOR, 3)
+
+                # Draw each LED's center and position
+                for (cX, cY), (x, y) in zip(LED_pixels.astype(int).tolist(), LEDs):
+                    cv2.circle(frame, (cX, cY), 4, CENTER_COLOR, -1)
+                    cv2.putText(frame, LED_FMT(x, y), (cX, cY), cv2.FONT_HERSHEY_PLAIN, 1, TEXT_COLOR, 2, cv2.LINE_AA)
+
+            if record:
+                # If the current time exceeds the time at which the next frame should be captured, save the current frame
+                now = time.time()
+                if now - mark >= 0:
+                    mark = mark + frame_interval
+
+                    putLatest(record_queue, frame)
+
+            groups = botDetector.groupNearbyPoints(LEDs, 1)
+
+            # Score every group against every pattern at once, then find the group that best matches each bot
+            # Write the position of each bot into its fixed row of the positions array
+            # Bots that are not detected are left as NaN
+            positions.fill(np.nan)
+            if len(groups) > 0:
+                scores = botDetector.scoreGroups(groups, PATTERNS)
+                best_groups = np.argmin(scores, axis=1)
+
+                for bot_idx in range(len(BOTS_IN_PLAY)):
+                    score = scores[bot_idx, best_groups[bot_idx]]
+                    if score < math.inf:
+                        print(BOTS_IN_PLAY[bot_idx] + ' matching score: ' + str(score))
+                        bot_point = botDetector.groupCenters([groups[best_groups[bot_idx]]])[0]
+                        positions[bot_idx] = bot_point
+
+                        sphere_point = cam.cartesianToSpherical(bot_point)
+                        # print(sphere_point)
+                        print(cam.sphericalToPixels(sphere_point))
+
+            if HAS_COMPASS:
+                # Read the magnetometer once per frame and reuse the reading
+                magnetic = sensor.magnetic
+                angle = getPitch(magnetic)
+                print('Compass heading: ' + str(angle))
+
+            # If the server is running, queue the bot positions for the transmission thread
+            if RUN_SERVER:
+                putLatest(positions_queue, positions.tobytes())
+
+            if DISPLAY:
+                cv2.imshow('frame', frame)
+
+    finally:
+        # Finish encoding the queued frames and close the video
+        # The end marker never blocks, even if the writer thread has stopped with a full queue
+        if record:
+            putLatest(record_queue, None)
+            record_thread.join()
 
-        if HAS_COMPASS:
-            angle = getPitch()
-            print('Compass heading: ' + str(angle))
+        # Stop the capture and transmission threads
+        stop_event.set()
+        for thread in threads:
+            thread.join()
 
-        # If the server is running, transmit the points to the client
+        # Close the TCP socket
         if RUN_SERVER:
+            conn.close()
+            print('TCP socket closed...')
 
-            # Split the list of captured LEDs into transmissible chunks
-            split_LEDs = [LEDs[i:i + 50] for i in range(0, len(LEDs), 50)]
-
-            num_packets = len(split_LEDs)
-            print("Num packets: " + str(num_packets))
-
-            timeout = 10  # in seconds
-
-            for i in range(num_packets):
-
-                ready_sockets, _, _ = select.select(
-                    [conn], [], [], timeout
-                )
-                if ready_sockets:
-                    response = conn.recv(256).decode()
-                    if response != 'OK':
-                        print('Bad response from client')
-                        break
-
-                else:
-                    print('No response')
-                    break
-
-                data = '['
-                for point in split_LEDs[i]:
-                    formatted_point = '({X:.2f}, {Y:.2f})'.format(X=point[0], Y=point[1])
-                    data += formatted_point + ', '
-
-                data = data[0:-2] + ']'
-
-                print('Sending ' + data)
-                conn.send(data.encode())
-
-            ready_sockets, _, _ = select.select(
-                [conn], [], [], timeout
-            )
-            if ready_sockets:
-                response = conn.recv(256).decode()
-                if response != 'OK':
-                    print('Bad response from client')
-                    break
-                print(response)
-            else:
-                print('No response')
-                break
-
-            data = 'EOT'
-            conn.send(data.encode())
-
+        # Destroy the display window for the live view
         if DISPLAY:
-            cv2.imshow('frame', frame)
-
-    # Close the TCP socket
-    if RUN_SERVER:
-        conn.close()
-        print('TCP socket closed...')
-
-    # Destroy the display window for the live view
-    if DISPLAY:
-        cv2.destroyAllWindows()
+            cv2.destroyAllWindows()
 
-    if IS_RPI:
-        # Stop recording from the Pi's camera
-        picam2.stop()
-    else:
-        # Stop recording from the Windows camera
-        vid.release()
-
-    # Convert the saved images to a video
-    if record:
-        makeVideo(name=session_name, image_folder=session_name)
+        if IS_RPI:
+            # Stop recording from the Pi's camera
+            picam2.stop()
+        else:
+            # Stop recording from the Windows camera
+            vid.release()
 
 
 if __name__ == '__main__':